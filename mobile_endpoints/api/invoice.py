@@ -1,14 +1,24 @@
+import hashlib
+
 import frappe
 from frappe.utils import cstr, cint
 
+from mobile_endpoints.api.utils import (
+    _decode_cursor,
+    _encode_cursor,
+    _get_permission_conditions,
+    _json_response,
+)
+
 @frappe.whitelist(methods=["GET"])
 def get_invoices(
     start_date: str | None = None,
     end_date: str | None = None,
     supplier: str | None = None,
-    page: int | str = 1,
+    page: int | str | None = None,
     page_size: int | str = 20,
     search: str | None = None,
+    cursor: str | None = None,
 ):
     """
     Returns minimal invoice list for the mobile app.
@@ -17,9 +27,15 @@ def get_invoices(
       - start_date (YYYY-MM-DD)
       - end_date (YYYY-MM-DD)
       - supplier (supplier code or exact name stored in 'supplier')
-      - page (1-based)
+      - cursor (opaque; `next_cursor` of the previous response)
+      - page (1-based, deprecated: only used when no cursor is given)
       - page_size
       - search (optional text search on name/supplier_name)
+
+    total_count is only computed when no cursor is given; clients paging
+    with a cursor should keep the value from the first response.
+
+    Responses carry an ETag; a matching If-None-Match gets an empty 304.
     """
     doctype = "Invoice Form"
 
@@ -27,83 +43,212 @@ def get_invoices(
     if not frappe.has_permission(doctype=doctype, ptype="read"):
         frappe.throw("Not permitted", frappe.PermissionError)
 
-    page = max(1, cint(page))
     page_size = max(1, min(100, cint(page_size)))
-    start = (page - 1) * page_size
-
-    filters = []
-
-    # Date filtering on posting_date
-    if start_date:
-        filters.append(["posting_date", ">=", cstr(start_date)])
-    if end_date:
-        filters.append(["posting_date", "<=", cstr(end_date)])
-
-    # Supplier filter (matches stored 'supplier' field value)
-    if supplier:
-        filters.append(["supplier", "=", cstr(supplier)])
-
-    # Minimal fields required by the Vue list page
-    fields = [
-        "name",             # used for id and invoiceNumber
-        "posting_date",     # date
-        "supplier",         # supplierId
-        "supplier_name",    # supplierName
-        "grand_total",      # amount
-    ]
-
-    order_by = "posting_date desc, creation desc"
 
-    # Base query
-    rows = frappe.get_all(
-        doctype,
-        fields=fields,
-        filters=filters,
-        order_by=order_by,
-        start=start,
-        page_length=page_size,
-        ignore_permissions=False,
+    conditions, values = _get_invoice_conditions(start_date, end_date, supplier, search)
+
+    if cursor:
+        # Keyset pagination: seek past the last (posting_date, creation, name)
+        # seen instead of scanning and discarding OFFSET rows. creation is not
+        # guaranteed unique (imports, bulk inserts), so name breaks ties.
+        last = _decode_cursor(cursor)
+        conditions.append(
+            "(posting_date < %(cursor_date)s"
+            " or (posting_date = %(cursor_date)s and (creation < %(cursor_creation)s"
+            " or (creation = %(cursor_creation)s and name < %(cursor_name)s))))"
+        )
+        values.update(
+            cursor_date=last.get("posting_date"),
+            cursor_creation=last.get("creation"),
+            cursor_name=last.get("name"),
+        )
+        page = None
+        start = 0
+        # The window count would have to evaluate the whole filtered set,
+        # which is exactly what the cursor seek avoids
+        total_column = ""
+    else:
+        page = max(1, cint(page))
+        start = (page - 1) * page_size
+        # Page and total count in one round-trip: the window count is computed
+        # over the filtered set before LIMIT/OFFSET is applied
+        total_column = ", count(*) over() as _total"
+
+    # One extra row tells us whether there is a next page
+    values.update(page_length=page_size + 1, start=start)
+
+    rows = frappe.db.sql(
+        f"""
+        select
+            name,             -- used for id and invoiceNumber
+            posting_date,     -- date
+            supplier,         -- supplierId
+            supplier_name,    -- supplierName
+            grand_total,      -- amount
+            lock_update,      -- permission.locked
+            owner,            -- permission (if owner rights)
+            modified,         -- ETag
+            creation          -- cursor tie-breaker
+            {total_column}
+        from `tabInvoice Form`
+        where {" and ".join(conditions) or "1=1"}
+        order by posting_date desc, creation desc, name desc
+        limit %(page_length)s offset %(start)s
+        """,
+        values,
+        as_dict=True,
     )
 
-    # Optional simple search (post-filter on retrieved page or expand query if needed)
-    if search:
-        s = cstr(search).strip().lower()
-        rows = [
-            r for r in rows
-            if s in cstr(r.name).lower() or s in cstr(r.get("supplier_name") or "").lower()
-        ]
-
-    # Total count (approx; respects basic doc permissions but not shared granularities)
-    total_count = frappe.db.count(doctype, filters=filters)
-
-    # Shape response for the mobile app
-    invoices = []
-    for r in rows:
-        invoices.append({
+    total_count = None
+    if not cursor:
+        # Out-of-range pages return no rows, so no total either
+        total_count = rows[0]._total if rows else 0
+
+    has_more = len(rows) > page_size
+    next_cursor = None
+    if has_more:
+        rows = rows[:page_size]
+        next_cursor = _encode_cursor(
+            {"posting_date": rows[-1].posting_date, "creation": rows[-1].creation, "name": rows[-1].name}
+        )
+
+    # Role permissions only differ by ownership: build the owner and
+    # non-owner dicts (and their locked variants) once and share them
+    permission = _get_permission_flags(doctype)
+    owner_permission = _get_permission_flags(doctype, is_owner=True)
+    permissions = {
+        (False, False): permission,
+        (False, True): {**permission, "locked": True},
+        (True, False): owner_permission,
+        (True, True): {**owner_permission, "locked": True},
+    }
+    user = frappe.session.user
+
+    # Every field below changes `modified`, so the page identity is enough
+    # to validate the client's copy without shaping or serializing anything
+    if _etag_matches(
+        page, page_size, total_count, has_more, next_cursor, permission, owner_permission,
+        *((r.name, r.modified) for r in rows),
+    ):
+        return
+
+    # Shape response for the mobile app. name is already a str and
+    # grand_total is a NOT NULL currency column (Decimal), so only the date
+    # and amount need converting
+    invoices = [
+        {
             "id": r.name,                               # string id for routing
             "invoiceNumber": r.name,
             "supplierId": r.supplier or "",
             "supplierName": r.supplier_name or "",
-            "date": cstr(r.posting_date),
-            "amount": float(r.grand_total or 0),
-            "permission": {
-                "can_update": True,
-                "can_delete": True,
-                "can_submit": True,
-                "locked": False,
-            },
-        })
-
-    has_more = (start + len(invoices)) < total_count
+            "date": r.posting_date.isoformat() if r.posting_date else "",
+            "amount": float(r.grand_total),
+            "permission": permissions[r.owner == user, bool(r.lock_update)],
+        }
+        for r in rows
+    ]
 
-    return {
+    return _json_response({
         "invoices": invoices,
         "page": page,
         "page_size": page_size,
         "total_count": total_count,
         "has_more": has_more,
+        "next_cursor": next_cursor,
+    })
+
+
+def _get_invoice_conditions(
+    start_date: str | None = None,
+    end_date: str | None = None,
+    supplier: str | None = None,
+    search: str | None = None,
+):
+    """
+    Translates the list filters into parameterized SQL conditions for
+    `tabInvoice Form`, including the user's permission match conditions.
+    """
+    conditions = []
+    values = {}
+
+    # Date filtering on posting_date
+    if start_date:
+        conditions.append("posting_date >= %(start_date)s")
+        values["start_date"] = cstr(start_date)
+    if end_date:
+        conditions.append("posting_date <= %(end_date)s")
+        values["end_date"] = cstr(end_date)
+
+    # Supplier filter (matches stored 'supplier' field value)
+    if supplier:
+        conditions.append("supplier = %(supplier)s")
+        values["supplier"] = cstr(supplier)
+
+    # Text search runs in the same query so pages stay full and total_count
+    # matches what the user sees
+    if search:
+        conditions.append("(name like %(search)s or supplier_name like %(search)s)")
+        values["search"] = f"%{cstr(search).strip()}%"
+
+    # Same row-level restrictions frappe.get_all applies with ignore_permissions=False
+    conditions.extend(_get_permission_conditions("Invoice Form", values))
+
+    return conditions, values
+
+
+def _get_permission_flags(doctype: str, is_owner: bool = False, name: str | None = None) -> dict:
+    """
+    Action flags for the mobile app from the user's role rights.
+    get_role_permissions resolves every ptype in one pass (cached on
+    frappe.local for the request) instead of one has_permission per action.
+
+    - is_owner: merge the role's "if owner" grants, as get_doc_permissions does
+    - name: also apply write/submit rights from DocShare for that document
+    """
+    perms = frappe.permissions.get_role_permissions(frappe.get_meta(doctype))
+    if is_owner:
+        # Copy: the role permissions dict is cached for the request
+        perms = {**perms, **perms.get("if_owner", {})}
+
+    flags = {
+        "can_update": bool(perms.get("write")),
+        "can_delete": bool(perms.get("delete")),
+        "can_submit": bool(perms.get("submit")),
+        "locked": False,
     }
 
+    if name and not (flags["can_update"] and flags["can_submit"]):
+        shares = frappe.get_all(
+            "DocShare",
+            filters={"share_doctype": doctype, "share_name": name},
+            or_filters={"user": frappe.session.user, "everyone": 1},
+            fields=["write", "submit"],
+        )
+        flags["can_update"] = flags["can_update"] or any(s.write for s in shares)
+        flags["can_submit"] = flags["can_submit"] or any(s.submit for s in shares)
+
+    return flags
+
+
+def _etag_matches(*parts) -> bool:
+    """
+    Sets a strong ETag derived from `parts` (and the session user) on the
+    response. Returns True, with status 304, when the client's If-None-Match
+    already holds it; the caller then returns without building the body.
+    """
+    etag = hashlib.md5(
+        ":".join(cstr(p) for p in (frappe.session.user, *parts)).encode()
+    ).hexdigest()
+
+    frappe.local.response_headers.set("ETag", f'"{etag}"')
+    # Let the app keep its copy but always revalidate
+    frappe.local.response_headers.set("Cache-Control", "private, no-cache")
+
+    if frappe.request and frappe.request.if_none_match.contains(etag):
+        frappe.local.response["http_status_code"] = 304
+        return True
+    return False
+
 
 @frappe.whitelist(methods=["GET"])
 def get_invoice_details(name: str):
@@ -111,46 +256,84 @@ def get_invoice_details(name: str):
     if not name:
         frappe.throw("Missing invoice name")
 
-    doc = frappe.get_doc(doctype, name)
-    if not doc.has_permission("read"):
-        frappe.throw("Not permitted", frappe.PermissionError)
+    # Two targeted queries instead of hydrating the doc and all its child
+    # tables. get_list applies the same read permission rules as
+    # doc.has_permission("read"), so an empty result means missing or not permitted.
+    parent = frappe.get_list(
+        doctype,
+        filters={"name": name},
+        fields=[
+            "name",
+            "docstatus",
+            "supplier",
+            "supplier_name",
+            "posting_date",
+            "grand_total",
+            "total_commissions_and_taxes",
+            "remarks",
+            "customer",
+            "lock_update",
+            "modified",
+            "owner",
+        ],
+        limit_page_length=1,
+    )
+    if not parent:
+        if frappe.db.exists(doctype, name):
+            frappe.throw("Not permitted", frappe.PermissionError)
+        frappe.throw(f"Invoice {name} not found", frappe.DoesNotExistError)
+    parent = parent[0]
 
     status_map = {0: "draft", 1: "submitted", 2: "cancelled"}
-    status = status_map.get(doc.docstatus or 0, "draft")
-    is_locked = bool(getattr(doc, "lock_update", False))
-
-    items = []
-    for it in getattr(doc, "items", []):
-        items.append({
-            "id": cstr(getattr(it, "name", "")),
-            "name": cstr(getattr(it, "item_name", "") or getattr(it, "item_code", "")),
-            "quantity": float(getattr(it, "qty", 0) or 0),
-            "price": float(getattr(it, "price", 0) or 0),
-            "total": float(getattr(it, "total", 0) or 0),
-            "customerId": cstr(getattr(it, "customer", "")),
-            "customerName": cstr(getattr(it, "customer", "")),
-        })
+    status = status_map.get(parent.docstatus or 0, "draft")
+    is_locked = bool(parent.lock_update)
+    permission = _get_permission_flags(
+        doctype, is_owner=parent.owner == frappe.session.user, name=parent.name
+    )
+
+    # Saving the doc (including its items) bumps the parent's modified
+    if _etag_matches(parent.name, parent.modified, permission):
+        return
+
+    rows = frappe.get_all(
+        "Invoice Form Item",
+        filters={"parent": name, "parenttype": doctype},
+        fields=["name", "item_name", "item_code", "qty", "price", "total", "customer"],
+        order_by="idx",
+    )
+
+    # Rows are plain dicts with every selected key present (None when unset)
+    items = [
+        {
+            "id": it.name or "",
+            "name": it.item_name or it.item_code or "",
+            "quantity": float(it.qty or 0),
+            "price": float(it.price or 0),
+            "total": float(it.total or 0),
+            "customerId": it.customer or "",
+            "customerName": it.customer or "",
+        }
+        for it in rows
+    ]
 
     return {
-        "id": cstr(getattr(doc, "name", name)),
-        "invoiceNumber": cstr(getattr(doc, "name", name)),
-        "supplierId": cstr(getattr(doc, "supplier", "")),
-        "supplierName": cstr(getattr(doc, "supplier_name", "")),  # FIX
-        "date": cstr(getattr(doc, "posting_date", "")),
-        "amount": float(getattr(doc, "grand_total", 0) or 0),
+        "id": cstr(parent.name),
+        "invoiceNumber": cstr(parent.name),
+        "supplierId": cstr(parent.supplier),
+        "supplierName": cstr(parent.supplier_name),  # FIX
+        "date": cstr(parent.posting_date),
+        "amount": float(parent.grand_total or 0),
         "status": status,
         "is_locked": is_locked,
         "items": items,
-        "tax": float(getattr(doc, "total_commissions_and_taxes", 0) or 0),
+        "tax": float(parent.total_commissions_and_taxes or 0),
         "payments": [],
-        "notes": cstr(getattr(doc, "remarks", "")),
+        "notes": cstr(parent.remarks),
         # ADD THESE for defaults/selects:
-        "customer": cstr(getattr(doc, "customer", "")),
-        "customer_name": cstr(getattr(doc, "customer", "")),
+        "customer": cstr(parent.customer),
+        "customer_name": cstr(parent.customer),
         "permission": {
-            "can_update": True,
-            "can_delete": True,
-            "can_submit": True,
+            **permission,
             "locked": is_locked,
         },
     }
@@ -179,6 +362,10 @@ def update_invoice(name: str, data: dict | None = None):
         doc.supplier = payload.get("supplier")
     if payload.get("supplier_name"):
         doc.supplier_name = payload.get("supplier_name")
+    elif payload.get("supplier"):
+        # Resolve the display name here with one keyed lookup rather than
+        # leaving the old name or a Supplier load to validation
+        doc.supplier_name = frappe.db.get_value("Supplier", payload["supplier"], "supplier_name") or ""
     # Replace items if provided
     if isinstance(payload.get("items"), list):
         doc.set("items", [])
@@ -191,7 +378,6 @@ def update_invoice(name: str, data: dict | None = None):
             row.total = it.get("total") or (row.qty * row.price)
             row.customer = it.get("customer") or it.get("customerId") or ""
     doc.save(ignore_permissions=False)
-    frappe.db.commit()
     return {"name": cstr(doc.name)}
 
 @frappe.whitelist(methods=["POST"])
@@ -202,14 +388,25 @@ def submit_invoice(name: str):
     if not name:
         frappe.throw("Missing invoice name")
     doctype = "Invoice Form"
+    # Read state and owner from the parent row before hydrating the doc and
+    # its child tables. Missing and forbidden invoices get the same error, and
+    # the draft check only runs once the caller's submit right (role, if
+    # owner or share) is established.
+    row = frappe.db.get_value(doctype, name, ["docstatus", "owner"], as_dict=True)
+    if not row:
+        frappe.throw("Not permitted", frappe.PermissionError)
+    is_owner = row.owner == frappe.session.user
+    if not _get_permission_flags(doctype, is_owner=is_owner, name=name)["can_submit"]:
+        frappe.throw("Not permitted", frappe.PermissionError)
+    if row.docstatus != 0:
+        frappe.throw("Only draft invoices can be submitted")
+
     doc = frappe.get_doc(doctype, name)
+    # Document-level check (user permissions, controller hooks)
     if not doc.has_permission("submit"):
         frappe.throw("Not permitted", frappe.PermissionError)
-    if doc.docstatus != 0:
-        frappe.throw("Only draft invoices can be submitted")
 
     doc.submit()
-    frappe.db.commit()
     return {"name": cstr(doc.name), "docstatus": doc.docstatus}
 
 @frappe.whitelist(methods=["POST"])
@@ -220,16 +417,40 @@ def delete_invoice(name: str):
     if not name:
         frappe.throw("Missing invoice name")
     doctype = "Invoice Form"
-    doc = frappe.get_doc(doctype, name)
-    if not doc.has_permission("delete"):
+    # Same gate as submit_invoice: missing and forbidden invoices get the same
+    # error, with "if owner" delete rights resolved against the row's owner
+    owner = frappe.db.get_value(doctype, name, "owner")
+    if owner is None:
+        frappe.throw("Not permitted", frappe.PermissionError)
+    if not _get_permission_flags(doctype, is_owner=owner == frappe.session.user)["can_delete"]:
         frappe.throw("Not permitted", frappe.PermissionError)
+    # delete_doc loads the doc once and enforces the delete permission itself
+    # (raises PermissionError), so no separate get_doc is needed here
     frappe.delete_doc(doctype, name, ignore_permissions=False)
-    frappe.db.commit()
     return {"deleted": True}
 
 import json
 from frappe.utils import nowtime, flt
 
+def _compute_line_totals(items: list) -> float:
+    """
+    Normalizes qty/price/total on each item dict in a single pass and
+    returns the grand total, so the child rows can be built from the
+    coerced values without calling flt() again.
+    """
+    grand_total = 0.0
+    for it in items:
+        qty = flt(it.get("qty") or it.get("quantity") or 0)
+        price = flt(it.get("price") or 0)
+        if not it.get("item_code") and it.get("item_name"):
+            it["item_code"] = it["item_name"]
+        line_total = flt(it.get("total")) or (qty * price)
+        it["qty"] = qty
+        it["price"] = price
+        it["total"] = line_total
+        grand_total += line_total
+    return grand_total
+
 @frappe.whitelist(methods=["POST"])
 def create_invoice_form():
     """
@@ -245,6 +466,9 @@ def create_invoice_form():
       "commission_rate": 5,           # optional, default 5
       "tax_rate": 15                  # optional, default 15
     }
+
+    Returns {name, grand_total, total_commissions_and_taxes}; call
+    get_invoice_details(name) for the full invoice.
     """
     data = frappe.form_dict.get("data")
     if isinstance(data, str):
@@ -268,15 +492,7 @@ def create_invoice_form():
         frappe.throw("At least one item is required")
 
     # Compute totals safely
-    grand_total = 0.0
-    for it in items:
-        qty = flt(it.get("qty") or it.get("quantity") or 0)
-        price = flt(it.get("price") or 0)
-        if not it.get("item_code") and it.get("item_name"):
-            it["item_code"] = it["item_name"]
-        line_total = flt(it.get("total")) or (qty * price)
-        it["total"] = line_total
-        grand_total += line_total
+    grand_total = _compute_line_totals(items)
 
     total_commission = (grand_total * commission_rate) / 100.0
     taxes_on_commission = (total_commission * tax_rate) / 100.0
@@ -294,22 +510,23 @@ def create_invoice_form():
         "pamper_commission": pamper_commission,
         "grand_total": grand_total,
         "total_commissions_and_taxes": total_commissions_and_taxes,
-        "items": [],
+        # Items table: built as plain dicts and passed in one go instead of
+        # doc.append per row
+        "items": [
+            {
+                "doctype": "Invoice Form Item",
+                "item_code": it.get("item_code"),
+                "item_name": it.get("item_name") or it.get("item_code"),
+                "qty": it["qty"],
+                "price": it["price"],
+                "total": it["total"],
+                "customer": it.get("customer") or "",
+            }
+            for it in items
+        ],
         "commissions": [],
     })
 
-    # Items table
-    for it in items:
-        doc.append("items", {
-            "item_code": it.get("item_code"),
-            "item_name": it.get("item_name") or it.get("item_code"),
-            "qty": flt(it.get("qty") or it.get("quantity") or 0),
-            "price": flt(it.get("price") or 0),
-            "total": flt(it.get("total") or 0),
-            "customer": it.get("customer") or "",
-        })
-
-    
     # If your doctype has pamper_commissions child table, populate as needed
     # for now, we leave it empty to match your example when zero
 
@@ -317,36 +534,9 @@ def create_invoice_form():
     # If you want to immediately submit:
     # doc.submit()
 
+    # Minimal payload: clients call get_invoice_details(name) for the full object
     return {
         "name": doc.name,
-        "posting_date": doc.posting_date,
-        "supplier": doc.supplier,
-        "supplier_name": doc.supplier_name,
-        "grand_total": doc.get("grand_total"),
-        "total_commissions_and_taxes": doc.get("total_commissions_and_taxes"),
-        "pamper_commission": doc.get("pamper_commission"),
-        "doctype": doc.doctype,
-        "items": [
-            {
-                "item_code": r.item_code,
-                "item_name": r.item_name,
-                "qty": r.qty,
-                "price": r.price,
-                "total": r.total,
-                "commission": r.get("commission"),
-                "customer": r.get("customer"),
-                "couple_customer": r.get("couple_customer"),
-                "has_commission_invoice": r.get("has_commission_invoice"),
-            } for r in doc.items
-        ],
-        "commissions": [
-            {
-                "item": r.item,
-                "price": r.price,
-                "commission": r.commission,
-                "total_commission": r.total_commission,
-                "taxes": r.taxes,
-                "commission_total": r.commission_total,
-            } for r in doc.commissions
-        ],
-    }
\ No newline at end of file
+        "grand_total": doc.grand_total,
+        "total_commissions_and_taxes": doc.total_commissions_and_taxes,
+    }
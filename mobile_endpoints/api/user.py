@@ -1,9 +1,13 @@
-import frappe  
-from erpnext import get_default_company  
-  
-@frappe.whitelist()  
-def get_user_default_company():  
-    """Get user's default company from session defaults"""  
-    return {  
-        "default_company": get_default_company()  
-    }
\ No newline at end of file
+import frappe
+from erpnext import get_default_company
+
+
+@frappe.whitelist()
+def get_user_default_company():
+    """Get user's default company from session defaults"""
+    # No extra cache layer: frappe.defaults already caches user defaults in
+    # Redis and clears them on every write path (set_user_default, User
+    # Permission, session defaults), none of which save the User doc
+    return {
+        "default_company": get_default_company()
+    }
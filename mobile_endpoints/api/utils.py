@@ -1,49 +1,217 @@
+import base64
+import json
+import re
+
 import frappe
+import orjson
 from frappe.utils import cint, cstr
+from frappe.utils.response import json_handler
+from werkzeug.wrappers import Response
 
-@frappe.whitelist(methods=["GET"])
-def get_supplier(page: int | str = 1, page_size: int | str = 100, search: str | None = None):
+SUPPLIER_CACHE_PREFIX = "mobile:farmers:"
+
+
+def _encode_cursor(values: dict) -> str:
+    """Opaque pagination cursor: urlsafe base64 of the last row's sort key."""
+    raw = json.dumps(values, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> dict:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cstr(cursor).encode()))
+    except ValueError:
+        values = None
+    if not isinstance(values, dict):
+        frappe.throw("Invalid cursor")
+    return values
+
+
+def _json_response(payload: dict) -> Response:
     """
-    Returns farmer suppliers for the mobile dropdown.
+    Serializes a list payload with orjson inside the usual {"message": ...}
+    envelope. frappe.handler passes Response objects through as-is, so the
+    stdlib json encoder is skipped for these larger responses.
+    """
+    return Response(
+        orjson.dumps({"message": payload}, default=json_handler),
+        mimetype="application/json",
+    )
 
-    - Always filters suppliers where is_farmer = 1
-    - Optional search on supplier_name or name
-    - Pagination using page_size + 1 to compute has_more
+
+def _get_permission_conditions(doctype: str, values: dict) -> list:
     """
-    doctype = "Supplier"
-    if not frappe.has_permission(doctype=doctype, ptype="read"):
-        frappe.throw("Not permitted", frappe.PermissionError)
+    Row-level read restrictions for raw SQL on `doctype`, matching what
+    frappe.get_list applies. build_match_conditions covers user permissions,
+    if_owner and permission query conditions, but when the user only has
+    access through shares it returns no condition at all; restrict to the
+    shared names in that case.
+    """
+    conditions = []
+    match_conditions = frappe.build_match_conditions(doctype)
+    if match_conditions:
+        conditions.append(f"({match_conditions})")
 
-    page = max(1, cint(page))
-    page_size = max(1, min(200, cint(page_size)))
-    start = (page - 1) * page_size
+    if not frappe.permissions.get_role_permissions(frappe.get_meta(doctype)).get("read"):
+        shared = frappe.share.get_shared(doctype, frappe.session.user)
+        if shared:
+            conditions.append(f"`tab{doctype}`.name in %(shared_names)s")
+            values["shared_names"] = tuple(shared)
+        else:
+            conditions.append("1=0")
 
-    base_filters = [["is_farmer", "=", 1]]
+    return conditions
 
-    or_filters = None
-    if search:
-        s = f"%{cstr(search).strip()}%"
-        or_filters = [
-            ["Supplier", "supplier_name", "like", s],
-            ["Supplier", "name", "like", s],
-        ]
-
-    fields = ["name as id", "supplier_name as name"]
-
-    # Fetch one extra row to determine has_more without needing a separate count
-    rows = frappe.get_all(
-        doctype,
-        fields=fields,
-        filters=base_filters,
-        or_filters=or_filters,
-        order_by="supplier_name asc, name asc",
-        start=start,
-        page_length=page_size + 1,
+
+def _has_fulltext_index(doctype: str, fieldname: str) -> bool:
+    """Whether `fieldname` has a FULLTEXT index (see patches/v1_0/add_lookup_fulltext_indexes)."""
+
+    def check():
+        if frappe.db.db_type != "mariadb":
+            return False
+        return bool(
+            frappe.db.sql(
+                f"show index from `tab{doctype}` where Index_type = 'FULLTEXT' and Column_name = %s",
+                fieldname,
+            )
+        )
+
+    return frappe.cache().get_value(f"mobile:fulltext:{doctype}:{fieldname}", generator=check)
+
+
+def _get_search_conditions(
+    doctype: str,
+    label_field: str,
+    prefix_fields: list,
+    search: str,
+    values: dict,
+) -> list:
+    """
+    Alternative search predicates, one per indexed column: MATCH ... AGAINST
+    on the label's FULLTEXT index when present (prefix LIKE otherwise), and
+    a prefix LIKE for each ID in `prefix_fields` on its btree index.
+    A leading-wildcard LIKE '%term%' would force a full table scan.
+
+    The predicates are meant to be UNIONed, not ORed: MariaDB cannot use a
+    FULLTEXT index as the access path when MATCH sits inside an OR.
+    """
+    term = cstr(search).strip()
+    values["search"] = f"{term}%"
+
+    # Boolean mode: every word required, each as a prefix. Words shorter than
+    # InnoDB's default min token size (3) are not indexed, so those go to LIKE.
+    words = [w for w in re.split(r"[\s+\-<>()~*\"@]+", term) if w]
+    if words and all(len(w) >= 3 for w in words) and _has_fulltext_index(doctype, label_field):
+        values["search_ft"] = " ".join(f"+{w}*" for w in words)
+        label_condition = f"match({label_field}) against (%(search_ft)s in boolean mode)"
+    else:
+        label_condition = f"{label_field} like %(search)s"
+
+    return [label_condition, *(f"{field} like %(search)s" for field in prefix_fields)]
+
+
+def _get_lookup_page(
+    doctype: str,
+    label_field: str,
+    conditions: list,
+    values: dict,
+    page: int | str | None,
+    page_size: int,
+    cursor: str | None,
+    search_conditions: list | None = None,
+):
+    """
+    Dropdown rows ordered by (label_field, name).
+
+    With a cursor the page starts right after the last row seen (keyset
+    pagination); otherwise the deprecated 1-based page offset is used.
+    Fetches page_size + 1 rows to compute has_more without a count.
+    Each of `search_conditions` runs as its own UNION branch so every
+    branch can use its own index.
+    """
+    table = f"`tab{doctype}`"
+    conditions = list(conditions)
+
+    conditions.extend(_get_permission_conditions(doctype, values))
+
+    if cursor:
+        last = _decode_cursor(cursor)
+        conditions.append(
+            f"({label_field} > %(cursor_label)s"
+            f" or ({label_field} = %(cursor_label)s and {table}.name > %(cursor_name)s))"
+        )
+        values.update(cursor_label=last.get("label"), cursor_name=last.get("name"))
+        start = 0
+    else:
+        start = (max(1, cint(page)) - 1) * page_size
+
+    # Each branch only needs the rows up to the end of the requested page
+    values.update(page_length=page_size + 1, start=start, branch_limit=start + page_size + 1)
+
+    # Every branch is sorted and limited on its own so a short typeahead
+    # prefix does not materialize all matches before the outer LIMIT.
+    # Inside a branch `name` must be qualified: the alias is the label column.
+    branches = []
+    for search_condition in search_conditions or [None]:
+        where = [*conditions, search_condition] if search_condition else conditions
+        branches.append(
+            f"""
+            (select {table}.name as id, {label_field} as name
+            from {table}
+            where {" and ".join(where) or "1=1"}
+            order by {label_field} asc, {table}.name asc
+            limit %(branch_limit)s)
+            """
+        )
+
+    # UNION (distinct) drops rows matched by more than one branch; ordering
+    # the derived table by its own columns keeps `name` unambiguous
+    rows = frappe.db.sql(
+        f"""
+        select id, name
+        from ({" union ".join(branches)}) lookup
+        order by name asc, id asc
+        limit %(page_length)s offset %(start)s
+        """,
+        values,
+        as_dict=True,
     )
 
     has_more = len(rows) > page_size
+    next_cursor = None
     if has_more:
         rows = rows[:page_size]
+        next_cursor = _encode_cursor({"label": rows[-1].name, "name": rows[-1].id})
+
+    return rows, has_more, next_cursor
+
+
+def _get_suppliers(
+    page: int | str | None,
+    page_size: int | str,
+    search: str | None,
+    cursor: str | None,
+) -> dict:
+    """Farmer supplier page, served from Redis when cached (see get_supplier)."""
+    doctype = "Supplier"
+    page_size = max(1, min(200, cint(page_size)))
+
+    # Typeahead hits this on every keystroke and the farmer list rarely
+    # changes; keyed per user because permission match conditions may differ
+    cache_key = f"{SUPPLIER_CACHE_PREFIX}{frappe.session.user}:{cursor or max(1, cint(page))}:{page_size}:{cstr(search).strip()}"
+    cached = frappe.cache().get_value(cache_key)
+    if cached is not None:
+        return cached
+
+    conditions = ["is_farmer = 1"]
+    values = {}
+    search_conditions = None
+    if search:
+        search_conditions = _get_search_conditions(doctype, "supplier_name", ["name"], search, values)
+
+    rows, has_more, next_cursor = _get_lookup_page(
+        doctype, "supplier_name", conditions, values, page, page_size, cursor, search_conditions
+    )
 
     suppliers = [
         {
@@ -53,77 +221,160 @@ def get_supplier(page: int | str = 1, page_size: int | str = 100, search: str |
         for r in rows
     ]
 
-    return {
+    result = {
         "suppliers": suppliers,
-        "page": page,
+        "page": None if cursor else max(1, cint(page)),
         "page_size": page_size,
         "has_more": has_more,
+        "next_cursor": next_cursor,
     }
+    frappe.cache().set_value(cache_key, result, expires_in_sec=300)
+    return result
+
+
+def clear_supplier_cache(doc, method=None, *args, **kwargs):
+    """
+    Supplier doc_events hook: drop every cached get_supplier page.
+    after_rename also passes (old, new, merge), hence *args.
+    """
+    frappe.cache().delete_keys(SUPPLIER_CACHE_PREFIX)
 
-@frappe.whitelist(methods=["GET"])
-def get_customer(page: int | str = 1, page_size: int | str = 20, search: str | None = None):
-    doctype = "Customer"
-    if not frappe.has_permission(doctype=doctype, ptype="read"):
-        frappe.throw("Not permitted", frappe.PermissionError)
 
-    page = max(1, cint(page))
+def _get_customers(
+    page: int | str | None,
+    page_size: int | str,
+    search: str | None,
+    cursor: str | None,
+) -> dict:
+    """Customer dropdown page (see get_customer)."""
+    doctype = "Customer"
     page_size = max(1, min(200, cint(page_size)))
-    start = (page - 1) * page_size
 
-    base_filters = []
-    or_filters = None
+    conditions = []
+    values = {}
+    search_conditions = None
     if search:
-        s = f"%{cstr(search).strip()}%"
-        or_filters = [["Customer", "customer_name", "like", s], ["Customer", "name", "like", s]]
-
-    fields = ["name as id", "customer_name as name"]
-    rows = frappe.get_all(
-        doctype,
-        fields=fields,
-        filters=base_filters,
-        or_filters=or_filters,
-        order_by="customer_name asc, name asc",
-        start=start,
-        page_length=page_size + 1,
+        search_conditions = _get_search_conditions(doctype, "customer_name", ["name"], search, values)
+
+    rows, has_more, next_cursor = _get_lookup_page(
+        doctype, "customer_name", conditions, values, page, page_size, cursor, search_conditions
     )
-    has_more = len(rows) > page_size
-    if has_more:
-        rows = rows[:page_size]
 
     customers = [{"id": r.get("id") or r.get("name"), "name": r.get("name") or r.get("customer_name") or r.get("id")} for r in rows]
-    return {"customers": customers, "page": page, "page_size": page_size, "has_more": has_more}
+    return {
+        "customers": customers,
+        "page": None if cursor else max(1, cint(page)),
+        "page_size": page_size,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+    }
 
 
-@frappe.whitelist(methods=["GET"])
-def get_items(page: int | str = 1, page_size: int | str = 20, search: str | None = None):
+def _get_items(
+    page: int | str | None,
+    page_size: int | str,
+    search: str | None,
+    cursor: str | None,
+) -> dict:
+    """Enabled item dropdown page (see get_items)."""
     doctype = "Item"
-    if not frappe.has_permission(doctype=doctype, ptype="read"):
-        frappe.throw("Not permitted", frappe.PermissionError)
-
-    page = max(1, cint(page))
     page_size = max(1, min(200, cint(page_size)))
-    start = (page - 1) * page_size
 
-    base_filters = [["disabled", "=", 0]]
-    or_filters = None
+    conditions = ["disabled = 0"]
+    values = {}
+    search_conditions = None
     if search:
-        s = f"%{cstr(search).strip()}%"
-        or_filters = [["Item", "item_name", "like", s], ["Item", "name", "like", s], ["Item", "item_code", "like", s]]
-
-    fields = ["name as id", "item_name as name"]
-    rows = frappe.get_all(
-        doctype,
-        fields=fields,
-        filters=base_filters,
-        or_filters=or_filters,
-        order_by="item_name asc, name asc",
-        start=start,
-        page_length=page_size + 1,
+        search_conditions = _get_search_conditions(
+            doctype, "item_name", ["name", "item_code"], search, values
+        )
+
+    rows, has_more, next_cursor = _get_lookup_page(
+        doctype, "item_name", conditions, values, page, page_size, cursor, search_conditions
     )
-    has_more = len(rows) > page_size
-    if has_more:
-        rows = rows[:page_size]
 
     # If you have a standard price list, you can fetch prices here as needed
     items = [{"id": r.get("id") or r.get("name"), "name": r.get("name") or r.get("id"), "price": 0} for r in rows]
-    return {"items": items, "page": page, "page_size": page_size, "has_more": has_more}
\ No newline at end of file
+    return {
+        "items": items,
+        "page": None if cursor else max(1, cint(page)),
+        "page_size": page_size,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+    }
+
+
+@frappe.whitelist(methods=["GET"])
+def get_supplier(
+    page: int | str | None = None,
+    page_size: int | str = 100,
+    search: str | None = None,
+    cursor: str | None = None,
+):
+    """
+    Returns farmer suppliers for the mobile dropdown.
+
+    - Always filters suppliers where is_farmer = 1
+    - Optional search on supplier_name (full-text words) or name (prefix)
+    - Keyset pagination: pass back `next_cursor` as `cursor` for the next page
+      (`page` is deprecated and only used when no cursor is given)
+    """
+    doctype = "Supplier"
+    if not frappe.has_permission(doctype=doctype, ptype="read"):
+        frappe.throw("Not permitted", frappe.PermissionError)
+
+    return _json_response(_get_suppliers(page, page_size, search, cursor))
+
+
+@frappe.whitelist(methods=["GET"])
+def get_customer(
+    page: int | str | None = None,
+    page_size: int | str = 20,
+    search: str | None = None,
+    cursor: str | None = None,
+):
+    doctype = "Customer"
+    if not frappe.has_permission(doctype=doctype, ptype="read"):
+        frappe.throw("Not permitted", frappe.PermissionError)
+
+    return _json_response(_get_customers(page, page_size, search, cursor))
+
+
+@frappe.whitelist(methods=["GET"])
+def get_items(
+    page: int | str | None = None,
+    page_size: int | str = 20,
+    search: str | None = None,
+    cursor: str | None = None,
+):
+    doctype = "Item"
+    if not frappe.has_permission(doctype=doctype, ptype="read"):
+        frappe.throw("Not permitted", frappe.PermissionError)
+
+    return _json_response(_get_items(page, page_size, search, cursor))
+
+
+@frappe.whitelist(methods=["GET"])
+def get_form_lookups(
+    search_supplier: str | None = None,
+    search_customer: str | None = None,
+    search_item: str | None = None,
+    page_size: int | str = 50,
+):
+    """
+    First page of the supplier, customer and item dropdowns in one call.
+
+    The invoice form needs all three on open; one request instead of three
+    saves two HTTP round-trips and auth cycles, and the queries run back to
+    back on the same DB connection. Each key holds the same payload as the
+    matching endpoint (get_supplier / get_customer / get_items); use its
+    `next_cursor` with that endpoint to page further.
+    """
+    for doctype in ("Supplier", "Customer", "Item"):
+        if not frappe.has_permission(doctype=doctype, ptype="read"):
+            frappe.throw("Not permitted", frappe.PermissionError)
+
+    return _json_response({
+        "suppliers": _get_suppliers(None, page_size, search_supplier, None),
+        "customers": _get_customers(None, page_size, search_customer, None),
+        "items": _get_items(None, page_size, search_item, None),
+    })
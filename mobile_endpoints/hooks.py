@@ -145,6 +145,14 @@ app_license = "mit"
 # 	}
 # }
 
+doc_events = {
+	"Supplier": {
+		"on_update": "mobile_endpoints.api.utils.clear_supplier_cache",
+		"on_trash": "mobile_endpoints.api.utils.clear_supplier_cache",
+		"after_rename": "mobile_endpoints.api.utils.clear_supplier_cache",
+	},
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -0,0 +1,10 @@
+import frappe
+
+
+def execute():
+    # get_invoices orders by (posting_date desc, creation desc) and seeks on
+    # the same pair with a cursor: lets ORDER BY + LIMIT read the index
+    # instead of a filesort
+    frappe.db.add_index("Invoice Form", ["posting_date", "creation"])
+    # Supplier-filtered lists: equality on supplier, then the date range
+    frappe.db.add_index("Invoice Form", ["supplier", "posting_date"])
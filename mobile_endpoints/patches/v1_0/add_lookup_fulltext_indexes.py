@@ -0,0 +1,23 @@
+import frappe
+
+# Label columns searched by the mobile dropdowns (mobile_endpoints.api.utils)
+FULLTEXT_INDEXES = {
+    "Supplier": "supplier_name",
+    "Customer": "customer_name",
+    "Item": "item_name",
+}
+
+
+def execute():
+    # MATCH ... AGAINST is MariaDB/MySQL only; other backends keep prefix LIKE
+    if frappe.db.db_type != "mariadb":
+        return
+
+    for doctype, fieldname in FULLTEXT_INDEXES.items():
+        index_name = f"{fieldname}_fulltext"
+        if frappe.db.has_index(f"tab{doctype}", index_name):
+            continue
+        frappe.db.sql_ddl(f"alter table `tab{doctype}` add fulltext index `{index_name}` (`{fieldname}`)")
+
+    # Drop the cached "no index" answers so searches switch to MATCH right away
+    frappe.cache().delete_keys("mobile:fulltext:")